@@ -7,10 +7,16 @@ It is used to correct the perspective and eye fish distortions of the images.
 It uses a predefined intrinsic matrix and extrinsic parameters that
 have been empirically obtained by calibrating the camera with OpenCV.
 It can load another calibration from a JSON.
+
+That JSON can be generated with the fit mode from a folder of checkerboard scans:
+    python calibrate.py fit folder/with/checkerboards [--output calibration.json] [--pattern 9x6] [--square-size 25]
 """
 
 import os
+import sys
 import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 import cv2
 import numpy as np
@@ -23,6 +29,8 @@ INTRINSIC_MATRIX = np.array([[FOCAL_LENGTH, 0, SHAPE[1] // 2 - 800],  # The opti
 
 EXTRINSIC_PARAMETERS = np.array([1, 0, 0, -.1])  # Eye fish and perspective distortion.
 
+CALIBRATION_FILE_FORMATS = ('.png', '.jpg', '.jpeg')
+
 
 class progress_bar:
     def __init__(self, *iterable, append='', length=False, bar_size=100):
@@ -78,6 +86,78 @@ def calibrate_folder(path=r'\\10.10.204.24\scan4d\TENDER\HANDS\01_HANDS_SIN_CALI
     print('Done with calibration.')
 
 
+def find_corners(file, pattern_size=(9, 6), downscale=4):
+    """
+    Find the inner corners of the checkerboard in the image file.
+
+    The checkerboard is first located in a downscaled copy of the image (much faster on full resolution scans)
+    and then the corners are refined to subpixel precision in the full resolution image.
+
+    Returns the corners (N x 1 x 2 float32 array) and the image size (width, height) or None if not found.
+    """
+    image = cv2.imread(file, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+
+    small = cv2.resize(image, None, fx=1 / downscale, fy=1 / downscale, interpolation=cv2.INTER_AREA)
+    found, corners = cv2.findChessboardCorners(small, pattern_size,
+                                               cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK)
+    if not found:
+        return None
+
+    # Back to full resolution coordinates (pixel centers don't scale around 0 but around -.5).
+    corners = (corners + .5) * downscale - .5
+    # The downscaled corners are off by, at most, a couple of downscaled pixels. Look for the actual corner around them.
+    window = max(5, 2 * downscale)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, .01)
+    corners = cv2.cornerSubPix(image, corners.astype(np.float32), (window, window), (-1, -1), criteria)
+
+    return corners, (image.shape[1], image.shape[0])
+
+
+def fit_calibration(path, output='calibration.json', pattern=(9, 6), square_size=1., downscale=4, workers=None):
+    """
+    Compute the intrinsic matrix and distortion coefficients from a folder of checkerboard images.
+
+    Corners are detected in parallel (one process per core by default).
+    The result is saved in the format calibrate_folder(calibration_json=...) reads.
+    """
+    files = [os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(CALIBRATION_FILE_FORMATS)]
+    if not files:
+        raise FileNotFoundError(f'No checkerboard images in {path}.')
+    print(f'Looking for {pattern[0]}x{pattern[1]} checkerboards in {len(files)} images from {path}.')
+
+    with ProcessPoolExecutor(workers) as executor:
+        detections = list(progress_bar(executor.map(partial(find_corners, pattern_size=pattern, downscale=downscale), files),
+                                       length=len(files)))
+
+    image_points = [corners for corners, size in filter(None, detections)]
+    sizes = {size for corners, size in filter(None, detections)}
+    if not image_points:
+        raise ValueError('No checkerboard found in any image.')
+    if len(sizes) > 1:
+        raise ValueError(f'All the images must have the same resolution. Found: {sizes}.')
+    print(f'Checkerboard found in {len(image_points)} of {len(files)} images.')
+
+    # The checkerboard corners in its own coordinates (a plane at z=0), in square_size units.
+    object_corners = np.zeros((pattern[0] * pattern[1], 3), np.float32)
+    object_corners[:, :2] = np.mgrid[:pattern[0], :pattern[1]].T.reshape(-1, 2) * square_size
+    object_points = [object_corners] * len(image_points)
+
+    rms, intrinsic_matrix, extrinsic_parameters, _, _ = cv2.calibrateCamera(object_points, image_points, sizes.pop(), None, None)
+    print(f'Reprojection error (RMS): {rms:.3f} pixels.')
+
+    calibration_dict = {'camera_matrix': intrinsic_matrix.tolist(),
+                        'distortion_coefficients': extrinsic_parameters.ravel().tolist(),
+                        'rms': rms}
+    # Valid JSON and valid python dict, just like the rest of our JSONs.
+    with open(output, 'w') as file:
+        file.write(str(calibration_dict).replace("'", '"'))
+    print(f'Calibration saved in {output}.')
+
+    return intrinsic_matrix, extrinsic_parameters
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('path', nargs='?', default=r'\\10.10.204.24\scan4d\TENDER\HANDS\01_HANDS_SIN_CALIBRAR/',
@@ -91,5 +171,25 @@ def parse_args():
     return parser.parse_args()
 
 
+def parse_fit_args(args):
+    parser = argparse.ArgumentParser(prog='calibrate.py fit',
+                                     description='Compute the calibration JSON from a folder of checkerboard images.')
+    parser.add_argument('path', help='Path to the folder containing the checkerboard images (full resolution).')
+    parser.add_argument('--output', '-o', default='calibration.json',
+                        help='Path of the JSON to save the calibration in. (Default: calibration.json)')
+    parser.add_argument('--pattern', type=lambda s: tuple(map(int, s.lower().split('x'))), default=(9, 6),
+                        help='Number of inner corners of the checkerboard, as COLSxROWS. (Default: 9x6)')
+    parser.add_argument('--square-size', '--square_size', type=float, default=1.,
+                        help='Size of the checkerboard squares (only affects the units of the extrinsics). (Default: 1)')
+    parser.add_argument('--downscale', type=int, default=4,
+                        help='Downscale factor for the first corner detection pass. (Default: 4)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of processes detecting corners. (Default: number of cores)')
+    return parser.parse_args(args)
+
+
 if __name__ == '__main__':
-    calibrate_folder(**parse_args().__dict__)
+    if sys.argv[1:2] == ['fit']:
+        fit_calibration(**parse_fit_args(sys.argv[2:]).__dict__)
+    else:
+        calibrate_folder(**parse_args().__dict__)
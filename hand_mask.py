@@ -0,0 +1,170 @@
+"""
+Segmentation of the hand, computed once per image, to find its edges with a lookup instead of looking at the colors.
+
+The red channel (the one where the hand contrasts the most) is blurred and thresholded with Otsu.
+Only the biggest connected component is kept: the hand.
+Its boundary and the distance of every pixel to it (and to which boundary pixel) are computed once and cached,
+so both the landmark estimation (landmarks.get_landmarks) and the GUI (sticking points to the edges) can use them.
+
+Along a ray, the edge is found by jumping the distance to the boundary at each step (it can't be crossed before),
+so it only takes a few lookups instead of reading and convolving the whole ray.
+
+To compare it with the original method (the color changes along each ray) on a folder of images:
+    python hand_mask.py folder/with/images
+"""
+
+import os
+import argparse
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+import landmarks
+
+
+class HandMask:
+    def __init__(self, red: np.ndarray, blur=11):
+        """
+        red is the red channel of the image (image_bgr[..., 2] or image_rgb[..., 0]).
+        blur is the size of the Gaussian blur. Chosen empirically for our scanner, like the Canny edges of the GUI.
+        """
+        red_blured = cv2.GaussianBlur(red, (blur, blur), 0)
+        _, mask = cv2.threshold(red_blured, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+        # The background is what touches the borders of the image the most.
+        borders = np.concatenate([mask[0], mask[-1], mask[:, 0], mask[:, -1]])
+        if borders.mean() > .5:
+            mask = 1 - mask
+
+        # Keep only the biggest connected component (ignore dust, the ruler...).
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if count > 1:
+            hand = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
+            mask = (labels == hand).astype(np.uint8)
+
+        self.mask = mask
+        """1 in the hand, 0 in the background."""
+        self.boundary = mask - cv2.erode(mask, np.ones((3, 3), np.uint8))
+        """1 in the pixels of the hand next to the background."""
+        self._distance = None
+        self._nearest = None
+
+    @property
+    def distance(self):
+        """Distance of each pixel to the closest pixel of the boundary (0 in the boundary)."""
+        if self._distance is None:
+            self._distance = cv2.distanceTransform(1 - self.boundary, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        return self._distance
+
+    def prepare(self, snapping=False):
+        """
+        Compute in advance what line_edge needs (the distance) or also what closest_edge needs (if snapping).
+        Otherwise they are computed the first time they are needed.
+        """
+        if snapping and self._nearest is None:
+            # Each boundary pixel gets a label (in row-major order) and every other pixel the label of the closest one.
+            distance, labels = cv2.distanceTransformWithLabels(1 - self.boundary, cv2.DIST_L2, cv2.DIST_MASK_PRECISE,
+                                                               labelType=cv2.DIST_LABEL_PIXEL)
+            self._distance = distance
+            self._nearest = (labels, np.argwhere(self.boundary))
+        return self.distance
+
+    def closest_edge(self, x, y, radius=100):
+        """Returns the closest boundary pixel to the given point or the point itself if there's none within radius."""
+        self.prepare(snapping=True)
+        labels, boundary_pixels = self._nearest
+        if len(boundary_pixels) == 0 or self.distance[y, x] > radius:
+            return x, y
+        y_edge, x_edge = boundary_pixels[labels[y, x] - 1]
+        return x_edge, y_edge
+
+    def line_edge(self, image, point1: np.ndarray, point2=None, direction=None, direction_scale=1/3):
+        """
+        Same as landmarks.get_line_edge but using the boundary of the hand:
+        the first boundary pixel from the first point towards the second point (or in the direction of the vector).
+
+        If there's no boundary in that segment, it falls back to landmarks.get_line_edge on the image.
+        """
+        if not 0 <= point1[0] < self.mask.shape[1] or not 0 <= point1[1] < self.mask.shape[0]:
+            return point1
+
+        # Get the second point from the direction if it is not given.
+        if point2 is None:
+            point2 = point1 + np.array(direction) * direction_scale
+
+        vector = np.asarray(point2, float) - point1
+        length = np.linalg.norm(vector)
+        distance = self.distance
+        t = 0.
+        while length and t <= length:
+            x, y = np.round(point1 + vector * (t / length)).astype(int)
+            if not 0 <= x < distance.shape[1] or not 0 <= y < distance.shape[0]:
+                break
+            step = distance[y, x]
+            if step == 0:
+                return np.array([x, y])
+            # There's no boundary closer than step. Don't jump the whole way because of the rounding.
+            t += max(1., step - 1)
+
+        return landmarks.get_line_edge(image, point1, point2)
+
+
+def compare(path, closed=None):
+    """Print the time taken and the agreement between the color and the mask methods on the images in path."""
+    from handmeasure import INPUT_FILE_FORMATS, is_closed
+
+    times = {'color edges': [], 'mask construction': [], 'mask edges': [], 'mask snapping (GUI)': []}
+    differences = []
+    for file in os.listdir(path):
+        pose = closed if closed is not None else is_closed(file)
+        if not file.endswith(INPUT_FILE_FORMATS) or pose is None:
+            continue
+        image = cv2.imread(os.path.join(path, file))
+        if image is None:
+            continue
+        image_rgb = np.ascontiguousarray(image[..., ::-1])
+        landmarks_mediapipe = landmarks.get_mediapipe_landmarks(image_rgb)
+        if landmarks_mediapipe is None:
+            continue
+        estimate = landmarks.get_landmarks_closed if pose else landmarks.get_landmarks_opened
+
+        start = perf_counter()
+        color = estimate(image_rgb, landmarks_mediapipe)
+        times['color edges'].append(perf_counter() - start)
+
+        start = perf_counter()
+        hand_mask = HandMask(image[..., 2])
+        hand_mask.prepare()
+        times['mask construction'].append(perf_counter() - start)
+
+        start = perf_counter()
+        mask = estimate(image_rgb, landmarks_mediapipe, line_edge=hand_mask.line_edge)
+        times['mask edges'].append(perf_counter() - start)
+
+        # The first time the user sticks a point to an edge, the GUI also needs the closest boundary pixels.
+        start = perf_counter()
+        hand_mask.prepare(snapping=True)
+        times['mask snapping (GUI)'].append(perf_counter() - start)
+
+        differences.append(np.linalg.norm(color - mask, axis=1))
+        print(f'{file}: mean difference {differences[-1].mean():.1f} px, max {differences[-1].max():.1f} px.')
+
+    if not differences:
+        print('No images to compare.')
+        return
+    for step, seconds in times.items():
+        print(f'{step + ":":<24}{1000 * np.mean(seconds):8.1f} ms per image')
+    differences = np.concatenate(differences)
+    print(f'Landmarks: {len(differences)}. Difference between methods: median {np.median(differences):.1f} px, '
+          f'mean {differences.mean():.1f} px. Within 3 px: {100 * np.mean(differences <= 3):.0f}%.')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare the color and the mask methods to find the hand edges.')
+    parser.add_argument('path', help='Path to the folder containing the PNG images.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    compare(**parse_args().__dict__)
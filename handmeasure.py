@@ -10,29 +10,172 @@ Each type of hand (closed or opened) has a different set of landmarks and distan
 The JSON of each PNG will be saved with the same name but with a .json extension.
 The content of the JSON will be both a JSON valid file and a python dict.
 
+It can also be used as a library (no GUI, no files written) with iter_measure,
+which accepts paths or images already in memory and yields a record (a dict) per image.
+
 Usage:
-    python handmeasure.py <path> <save_path> [--auto] [--pixel-size <pixel_size>]
+    python handmeasure.py <path> <save_path> [--auto] [--jsonl] [--pixel-size <pixel_size>] [--preview-scale <scale>]
 
     <path> is the path to the folder containing the images.
     <save_path> is the path to the folder where the JSONs and JPGs will be saved.
     --auto: if present, the program will process all the images in the folder without human correction.
+    --jsonl: if present, nothing is saved or moved: a JSON record per image is written to stdout (one per line).
     --pixel-size: the size of the pixels in mm. Default: 1/12.36 (the size of the pixels in our scanner).
+    --preview-scale: scale of the .measures.jpg saved in auto mode (0 to not save it). Default: 0.5.
+    --preload: import MediaPipe and warm up its model in the background while the folder is listed.
+    --startup-report: print (to stderr) how long each step of the start up took.
+    --edges: how to find the edges of the hand, 'color' (the color changes along each line, default)
+             or 'mask' (a segmentation of the hand computed once per image, see hand_mask.py).
+    --lease-ttl: seconds after which the claim of an image by a dead instance expires (0 to not claim images).
+                 Default: 120. Claiming the images lets several instances work on the same folder (see lease.py).
 """
 
+from time import perf_counter
+_import_start = perf_counter()
+
 import os
+import sys
+import json
 import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import cv2
-import numpy as np
 
-from constants import points_interest_closed, points_interest_opened
-from GUI import CorrectorGUI
+from landmark_set import AUTO, LandmarkSet
+from lease import LEASE_TTL, claimed_files
 from measure import compute_distances, mesure_closed, mesure_opened
-# There's a conditional import: from landmarks import get_landmarks
-# It imports mediapipe which takes a lot of time to load. So it's imported only when needed, i.e.,
-# when the landmarks are not found in a previously generated JSON file.
+from render import save_preview
+# There are two conditional imports:
+# - import landmarks: its detector (landmarks.get_detector) imports mediapipe, which takes a lot of time to load.
+#   So it's only created when needed, i.e., when the landmarks are not found in a previously generated JSON file.
+#   Or in advance, in the background, with preload_detector.
+# - from GUI import CorrectorGUI: it's not needed in auto mode.
+# - from hand_mask import HandMask: only needed with edges='mask'.
 
 INPUT_FILE_FORMATS = ('.png', )
+PREVIEW_WORKERS = 2
+"""Threads saving the previews in auto mode. Each pending preview keeps a full resolution image in memory."""
+
+startup_times = {'import handmeasure': perf_counter() - _import_start}
+"""Seconds taken by each step of the start up. Shown with --startup-report."""
+_preload_thread = None
+"""Thread importing MediaPipe and warming up the detector, if preload_detector has been called."""
+
+
+def preload_detector():
+    """Import MediaPipe, create the detector and run it once in a background thread, so it's ready when needed."""
+    global _preload_thread
+
+    def preload():
+        import landmarks
+        landmarks.warm_up()  # Imports MediaPipe and creates the detector first. They time themselves.
+
+    if _preload_thread is None:
+        _preload_thread = threading.Thread(target=preload, name='preload_detector', daemon=True)
+        _preload_thread.start()
+    return _preload_thread
+
+
+def print_startup_report():
+    """Print how long each step of the start up took."""
+    times = dict(startup_times)
+    if 'landmarks' in sys.modules:
+        times |= sys.modules['landmarks'].startup_times
+    for step, seconds in times.items():
+        print(f'{step + ":":<24}{seconds:8.3f}s', file=sys.stderr)
+
+
+def is_closed(file):
+    """Return True if the filename is of a closed hand, False if it's of an opened one and None if it's neither."""
+    if 'close' in file.lower() or 'M1' in file.upper():
+        return True
+    elif 'open' in file.lower() or 'M2' in file.upper():
+        return False
+    return None
+
+
+def detect_landmarks(image_rgb, closed, hand_mask=None):
+    """Estimate the landmarks in the image (using the edges of hand_mask if given). Returns None if no hand is detected."""
+    # Time the first image waits for the detector to be ready:
+    # all the import and creation (see landmarks.startup_times) or what's left of it if preloaded.
+    start = perf_counter()
+    if _preload_thread is not None:
+        # The detector can't be used by two threads at the same time. Wait for the warm up to finish.
+        _preload_thread.join()
+    from landmarks import get_detector, get_landmarks
+    get_detector()  # The first time takes a while to load MediaPipe.
+    startup_times.setdefault('wait for detector', perf_counter() - start)
+
+    start = perf_counter()
+    landmarks = get_landmarks(image_rgb, closed, hand_mask=hand_mask)
+    startup_times.setdefault('first detection', perf_counter() - start)
+    if landmarks is None:
+        return None
+
+    # Flag them as generated automatically.
+    # We use this to paint the landmarks in the GUI in a different color to inform the user.
+    return LandmarkSet(landmarks, AUTO, closed)
+
+
+def landmarks_to_dict(landmarks: LandmarkSet, pixel_size=1/12.36, file=None):
+    """Return the content of the JSON of an image: the landmarks, pixel size, capture date and distances."""
+    content = landmarks.to_dict()
+    content['pixel_size'] = pixel_size
+
+    # If the date is in the filename, add it to the json file.
+    if file is not None and len(file) >= 13 and file[-13] == '.' and file[-12:-4].isdigit():
+        date = file[-12:-4]
+        content['capture_date'] = date[:4] + '-' + date[4:6] + '-' + date[6:]
+
+    # Firs compute, for each distance the start and end points in pixel coordinates.
+    # Then compute the distances in mm.
+    # This is done in two steps, so we can show the lines representing the distances in the GUI.
+    pixel_positions = mesure_closed(landmarks) if landmarks.closed else mesure_opened(landmarks)
+    content |= compute_distances(pixel_positions, pixel_size)
+    return content
+
+
+def iter_measure(images_or_paths, closed=None, pixel_size=1/12.36, edges='color'):
+    """
+    Lazily estimate the landmarks and measures of each image and yield a record (dict) per image.
+
+    images_or_paths can contain paths to images or RGB images already loaded (numpy arrays).
+    If closed is None, the pose is deduced from the filename (so it's needed for in-memory images).
+    edges is the method to find the edges of the hand: 'color' or 'mask' (see hand_mask.py).
+
+    Each record has the same content as the JSON saved by main, plus:
+    - 'file': the path of the image (None for in-memory images).
+    - 'closed': the pose of the hand.
+    - 'error': only if the image couldn't be measured. It's the only other key in that case.
+    """
+    for image in images_or_paths:
+        file = os.fspath(image) if isinstance(image, (str, os.PathLike)) else None
+        record = {'file': file}
+
+        pose = closed if closed is not None else (None if file is None else is_closed(os.path.basename(file)))
+        if pose is None:
+            yield record | {'error': 'Unknown pose: neither closed nor opened.'}
+            continue
+        record['closed'] = pose
+
+        if file is not None:
+            image = cv2.imread(file)
+            if image is None:
+                yield record | {'error': 'Image can not be read.'}
+                continue
+            image = image[..., ::-1]
+
+        hand_mask = None
+        if edges == 'mask':
+            from hand_mask import HandMask
+            hand_mask = HandMask(image[..., 0])
+        landmarks = detect_landmarks(image, pose, hand_mask)
+        if landmarks is None:
+            yield record | {'error': 'No hand detected.'}
+            continue
+
+        yield record | landmarks_to_dict(landmarks, pixel_size, file)
 
 
 def main(path=r'\\10.10.204.24\scan4d\TENDER\HANDS\02_HANDS_CALIBRADAS/',
@@ -43,8 +186,44 @@ def main(path=r'\\10.10.204.24\scan4d\TENDER\HANDS\02_HANDS_CALIBRADAS/',
                       # Also useful for not waiting to mediapipe when correcting labels.
          pixel_size=1/12.36,  # This value doesn't usually change unless the scanner is modified.
                               # But we periodically check it, measuring the contour ruler in the scans (I used GIMP).
+         jsonl=False,  # Don't save or move anything, just write a JSON record per image to stdout.
+         preview_scale=.5,  # Scale of the .measures.jpg saved in auto mode (with the GUI it's saved at full resolution).
+                            # 0 doesn't save it.
+         preload=False,  # Import MediaPipe and warm it up in the background while listing the folder.
+         startup_report=False,  # Print how long each step of the start up took.
+         edges='color',  # How to find the edges of the hand: 'color' (along each line) or 'mask' (segmentation).
+         lease_ttl=LEASE_TTL,  # Claim each image before processing it, so other instances skip it. 0 to not claim them.
          ):
-    for file in os.listdir(path):
+    if preload:
+        preload_detector()
+
+    start = perf_counter()
+    files = os.listdir(path)
+    startup_times['list folder'] = perf_counter() - start
+
+    if jsonl:
+        files = [os.path.join(path, file) for file in files if file.endswith(INPUT_FILE_FORMATS)]
+        for record in iter_measure(files, pixel_size=pixel_size, edges=edges):
+            sys.stdout.write(json.dumps(record) + '\n')
+            sys.stdout.flush()
+        if startup_report:
+            print_startup_report()
+        return
+
+    # In auto mode, the previews are drawn and saved in the background while the next image is processed.
+    # OpenCV releases the GIL, so threads are enough and the decoded image doesn't need to be copied to another process.
+    preview_pool = ThreadPoolExecutor(PREVIEW_WORKERS) if auto and preview_scale else None
+    previews = []
+
+    if lease_ttl:
+        # Several reviewers (or auto-detection computers) can work on the same folder at the same time.
+        # In auto mode the images aren't moved, so skip the ones another instance has already generated the JSON of.
+        def generated(file): return auto and os.path.exists(os.path.splitext(os.path.join(save_path, file))[0] + '.json')
+        files = claimed_files(path, files, INPUT_FILE_FORMATS, lease_ttl, skip=generated)
+    else:
+        files = ((file, None) for file in files)
+
+    for file, lease in files:
         if not file.endswith(INPUT_FILE_FORMATS):
             # Not the right file format. Skip this file.
             continue
@@ -53,55 +232,49 @@ def main(path=r'\\10.10.204.24\scan4d\TENDER\HANDS\02_HANDS_CALIBRADAS/',
         file = os.path.join(path, file)
 
         # Find out if the file is closed or opened.
-        if 'close' in file.lower() or 'M1' in file.upper():
-            closed = True
-        elif 'open' in file.lower() or 'M2' in file.upper():
-            closed = False
-        else:
+        closed = is_closed(file)
+        if closed is None:
             print(f'{file} no es ni abierto ni cerrado. Se ignora.')
             continue
 
-        points_interest = points_interest_closed if closed else points_interest_opened
-
         # Get the landmarks from the corresponding JSON file if exists in the destination folder
         # or generate them automatically if not.
         basename, extension = os.path.splitext(file_dst)
-        json = basename + '.json'
+        json_path = basename + '.json'
         save_landmarks_in_json = False
         """Whether to save the landmarks in the JSON file because the user modified them or they just got generated."""
+        hand_mask = None
+        """Segmentation of the hand, shared by the landmark estimation and the GUI. Only with edges='mask'."""
 
-        if os.path.exists(json):
-            print(f'Cargando puntos de {json}...')
-            with open(json, 'r') as json_file:
+        if os.path.exists(json_path):
+            print(f'Cargando puntos de {json_path}...')
+            with open(json_path, 'r') as json_file:
                 # Our JSONs are valid python dicts (no use of true, false or null).
                 landmarks_dict = eval(json_file.read())
-            # Take only the points of interest as an array (ignore the distances, date and pixel size).
-            landmarks = np.array([landmarks_dict[point] for point in points_interest])
+            # Take only the points of interest and their flags (ignore the distances, date and pixel size).
+            landmarks = LandmarkSet.from_dict(landmarks_dict, closed)
         else:
             print(f'{file} no tiene landmarks. Se generarán automaticamente.')
             image = cv2.imread(file)
             if image is None:
                 print(f'No se puede leer {file}.')
                 continue
-            image_rgb = image[..., ::-1]
-            from landmarks import get_landmarks  # The first time takes a while to load MediaPipe.
-            landmarks = get_landmarks(image_rgb, closed).astype(np.float32)
-            
+            if edges == 'mask':
+                from hand_mask import HandMask
+                hand_mask = HandMask(image[..., 2])
+            landmarks = detect_landmarks(image[..., ::-1], closed, hand_mask)
             if landmarks is None:
                 print(f'No se ha podido detectar la mano en {file}.')
                 continue
-            
-            # Add an infinitesimal amount to know that the landmarks have been generated automatically.
-            # We use this to paint the landmarks in the GUI in a different color to inform the user.
-            landmarks += .001
-            
+
             save_landmarks_in_json = True
 
         # Show the landmarks in the GUI and let the user correct them if not auto.
         if not auto:
             print(f'Corrige landmarks de {file}...')
+            from GUI import CorrectorGUI
             # Create an objet with all the information needed to show the GUI.
-            corrector_gui = CorrectorGUI(file, landmarks, file_dst)
+            corrector_gui = CorrectorGUI(file, landmarks, file_dst, edges, hand_mask)
             # Run the GUI and wait for the user to be done with this image.
             landmarks_updated = corrector_gui.event_loop()
             cv2.destroyWindow(corrector_gui.title)
@@ -109,24 +282,15 @@ def main(path=r'\\10.10.204.24\scan4d\TENDER\HANDS\02_HANDS_CALIBRADAS/',
                 save_landmarks_in_json = True
                 landmarks = landmarks_updated
 
-        if save_landmarks_in_json:
+        if save_landmarks_in_json and lease is not None and not lease.check():
+            # Our claim expired (e.g. the heartbeat couldn't reach the share) and someone else may be on it.
+            print(f'Se ha perdido el bloqueo de {file}. No se guarda nada.')
+        elif save_landmarks_in_json:
             print(f'Guardando landmarks de {file} actualizados.')
-            json_content = {point: landmarks[i].tolist() for i, point in enumerate(points_interest)}
-            json_content['pixel_size'] = pixel_size
-            
-            # If the date is in the filename, add it to the json file.
-            if len(file) >= 13 and file[-13] == '.' and file[-12:-4].isdigit():
-                date = file[-12:-4]
-                json_content['capture_date'] = date[:4] + '-' + date[4:6] + '-' + date[6:]
-            
-            # Firs compute, for each distance the start and end points in pixel coordinates.
-            # Then compute the distances in mm.
-            # This is done in two steps, so we can show the lines representing the distances in the GUI.
-            pixel_positions = mesure_closed(landmarks) if closed else mesure_opened(landmarks)
-            json_content |= compute_distances(pixel_positions, pixel_size)
-            
+            json_content = landmarks_to_dict(landmarks, pixel_size, file)
+
             # Save the JSON file. Start with a str representation of the dict and reformat it.
-            with open(json, 'w') as json_file:
+            with open(json_path, 'w') as json_file:
                 json_file.write(str(json_content)
                                 # Reformat the dict into a (pretty) JSON.
                                 .replace(", '", ",\n'")
@@ -135,20 +299,39 @@ def main(path=r'\\10.10.204.24\scan4d\TENDER\HANDS\02_HANDS_CALIBRADAS/',
                                 .replace("': [", "':\t[")
                                 .replace("'", '"')
                                 )
+
+            if preview_pool is not None:
+                # Don't let the decoded images pile up if the previews are slower than the detection.
+                pending = [preview for preview in previews if not preview.done()]
+                if len(pending) >= 2 * PREVIEW_WORKERS:
+                    wait(pending, return_when=FIRST_COMPLETED)
+                previews.append(preview_pool.submit(save_preview, image, landmarks, basename + '.measures.jpg', preview_scale))
             
             # Move the image to the destination folder unless it's already there.
             if os.path.exists(file_dst):
                 response = input(f'¿Sobreescribir {file_dst} con {file}? ([s]/n) ')
-                if response.strip().lower() not in ('n', 'no', 'not', 'non', 'na', 'nah', 'nay', 'nein'):
+                if lease is not None and not lease.check():
+                    print(f'Se ha perdido el bloqueo de {file}. No se ha movido a {file_dst}.')
+                elif response.strip().lower() not in ('n', 'no', 'not', 'non', 'na', 'nah', 'nay', 'nein'):
                     os.replace(file, file_dst)
                 else:
                     print(f'No se ha movido {file} a {file_dst}.')
             # In auto mode, leave the image in the original folder so that the user can check it.
-            elif not auto:
+            elif not auto and (lease is None or lease.check()):
                 os.rename(file, file_dst)
+            elif not auto:
+                print(f'Se ha perdido el bloqueo de {file}. No se ha movido a {file_dst}.')
         else:
             print(f'No se han actualizado los landmarks de {file}.')
 
+    if preview_pool is not None:
+        for preview in previews:
+            if preview.exception() is not None:
+                print(f'No se ha podido guardar una previsualización: {preview.exception()}')
+        preview_pool.shutdown()
+
+    if startup_report:
+        print_startup_report()
     print('Fin.')
 
 
@@ -167,6 +350,20 @@ def parse_args():
                         help='Generate the JSONs with the landmarks without human corrections. (Default: False)')
     parser.add_argument('--pixel-size', '--pixel_size', type=float, default=1/12.36,
                         help='Pixel size in mm. (Default: 1/12.36, the size of the pixels in our scanner')
+    parser.add_argument('--preview-scale', '--preview_scale', type=float, default=.5,
+                        help='Scale of the .measures.jpg saved in auto mode. 0 to not save it. (Default: 0.5)')
+    parser.add_argument('--preload', action='store_true', default=False,
+                        help='Import MediaPipe and warm up its model in the background while listing the folder. (Default: False)')
+    parser.add_argument('--startup-report', '--startup_report', action='store_true', default=False,
+                        help='Print how long each step of the start up took. (Default: False)')
+    parser.add_argument('--edges', choices=('color', 'mask'), default='color',
+                        help="How to find the edges of the hand: 'color' changes along each line "
+                             "or 'mask' (a segmentation of the hand computed once per image). (Default: color)")
+    parser.add_argument('--lease-ttl', '--lease_ttl', type=float, default=LEASE_TTL,
+                        help=f'Seconds after which the claim of an image by a dead instance expires. '
+                             f'0 to not claim images. (Default: {LEASE_TTL})')
+    parser.add_argument('--jsonl', action='store_true', default=False,
+                        help='Write a JSON record per image to stdout instead of saving JSONs and moving images. (Default: False)')
     
     return parser.parse_args()
 
@@ -0,0 +1,108 @@
+"""
+Container of the landmarks of a hand: their coordinates, their state and the pose of the hand.
+
+The coordinates are a contiguous (N, 2) float32 array and the state of each landmark is a uint8 of flags:
+- AUTO: estimated automatically (by MediaPipe and the hand edges), not by a human.
+- MOVED: placed by the user.
+- INVALID: the user deleted it. Its measures are invalid (but still computed, with a negative sign).
+
+The arrays aren't copied if they already have the right type, so a batch of hands can share the same buffer:
+    coords = np.zeros((len(images), 23, 2), np.float32)
+    hands = [LandmarkSet(c, closed=False) for c in coords]
+
+Our JSONs used to store the state in the coordinates themselves:
+negative coordinates for invalid points and an infinitesimal (+.001) fraction for the automatic ones.
+They still do (to keep them readable by everything that already reads them),
+but the flags are saved too, so they can be read back without losing anything
+(even landmarks outside the image, with actual negative coordinates, which the old format can't tell from invalid ones).
+"""
+
+import numpy as np
+
+from constants import points_interest_closed, points_interest_opened
+
+AUTO = 1
+MOVED = 2
+INVALID = 4
+
+AUTO_OFFSET = .001
+"""Fraction added to the automatic landmarks in the old format (the one stored in the JSON points)."""
+
+
+class LandmarkSet:
+    __slots__ = ('coords', 'flags', 'closed')
+
+    def __init__(self, coords, flags=0, closed=None):
+        self.coords = np.ascontiguousarray(coords, np.float32)
+        """Pixel coordinates (x, y) of each landmark. They can be negative (outside the image)."""
+        flags = np.asarray(flags, np.uint8)
+        self.flags = np.full(len(self.coords), flags, np.uint8) if flags.ndim == 0 else np.ascontiguousarray(flags)
+        """AUTO, MOVED and INVALID flags of each landmark."""
+        if closed is None:
+            if len(self.coords) not in (len(points_interest_closed), len(points_interest_opened)):
+                raise ValueError(f'Unknown pose for {len(self.coords)} landmarks.')
+            closed = len(self.coords) == len(points_interest_closed)
+        self.closed = closed
+        """Pose of the hand."""
+
+    @property
+    def names(self):
+        return points_interest_closed if self.closed else points_interest_opened
+
+    @property
+    def invalid(self):
+        """Boolean mask of the invalid landmarks."""
+        return (self.flags & INVALID).astype(bool)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __eq__(self, other):
+        return (isinstance(other, LandmarkSet) and self.closed == other.closed
+                and np.array_equal(self.coords, other.coords) and np.array_equal(self.flags, other.flags))
+
+    def copy(self):
+        return LandmarkSet(self.coords.copy(), self.flags.copy(), self.closed)
+
+    def move(self, index, x, y):
+        """Place the landmark where the user says. It's no longer automatic nor invalid."""
+        self.coords[index] = x, y
+        self.flags[index] = MOVED
+
+    def toggle_invalid(self, index):
+        self.flags[index] ^= INVALID
+
+    @classmethod
+    def from_legacy(cls, points, closed=None):
+        """Read the landmarks from the old format: negative if invalid, with a .001 fraction if automatic."""
+        points = np.asarray(points, np.float32)
+        invalid = np.any(points < 0, axis=1)
+        points = np.abs(points)
+        auto = np.any(points % 1 != 0, axis=1)
+        flags = np.where(auto, AUTO, MOVED).astype(np.uint8) | np.where(invalid, INVALID, 0).astype(np.uint8)
+        return cls(points - auto[:, None] * np.float32(AUTO_OFFSET), flags, closed)
+
+    def to_legacy(self):
+        """Return the landmarks in the old format: negative if invalid, with a .001 fraction if automatic."""
+        auto = (self.flags & AUTO).astype(np.float32)
+        return (self.coords + auto[:, None] * AUTO_OFFSET) * np.where(self.invalid, -1, 1)[:, None].astype(np.float32)
+
+    @classmethod
+    def from_dict(cls, content, closed):
+        """Read the landmarks from the content of one of our JSONs."""
+        names = points_interest_closed if closed else points_interest_opened
+        points = [content[name] for name in names]
+        if 'landmark_flags' not in content:
+            # JSON saved before the flags were stored.
+            return cls.from_legacy(points, closed)
+        # Exactly the inverse of to_legacy.
+        flags = np.array(content['landmark_flags'], np.uint8)
+        auto = (flags & AUTO).astype(np.float32)
+        sign = np.where(flags & INVALID, -1, 1)[:, None].astype(np.float32)
+        return cls(np.array(points, np.float32) * sign - auto[:, None] * AUTO_OFFSET, flags, closed)
+
+    def to_dict(self):
+        """Return the landmarks as they are saved in our JSONs: the points in the old format and the flags."""
+        content = {name: point.tolist() for name, point in zip(self.names, self.to_legacy())}
+        content['landmark_flags'] = self.flags.tolist()
+        return content
@@ -4,17 +4,75 @@ Here the landmarks are estimated from the image.
 The MediaPipe Hand landmarks are used as a starting point.
 Their relative positions are used to determine a line in the image that probably goes through our landmark.
 Along that line, the edge of the hand is searched for and used as our landmark.
+By default, the edge is where the colors change the most along the line (get_line_edge).
+It can also be looked up in a segmentation of the hand (hand_mask.HandMask.line_edge).
+
+MediaPipe takes a while to import and its model takes a while to load and to run the first time.
+So it's only imported when the detector is created (get_detector) and that can be done in advance (warm_up).
 """
 
+import threading
+from time import perf_counter
+
 import numpy as np
-from mediapipe.python.solutions.hands import Hands
 
 from constants import *
 
+_detector = None
+"""MediaPipe Hands detector shared by all the calls to get_landmarks. Created by get_detector."""
+_detector_lock = threading.Lock()
+startup_times = {}
+"""Seconds taken to import MediaPipe, create the detector and warm it up (the first time of each)."""
+
+
+def create_detector():
+    """Create a new MediaPipe Hands detector for single images."""
+    start = perf_counter()
+    from mediapipe.python.solutions.hands import Hands  # Takes a while.
+    startup_times.setdefault('import mediapipe', perf_counter() - start)
+
+    start = perf_counter()
+    detector = Hands(static_image_mode=True, max_num_hands=1)
+    startup_times.setdefault('create detector', perf_counter() - start)
+    return detector
+
+
+def get_detector():
+    """Return the shared detector. It's created the first time."""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = create_detector()
+    return _detector
+
+
+def warm_up(detector=None):
+    """Run the detector on a dummy image, so the first actual image doesn't have to wait for the model to load."""
+    detector = detector or get_detector()
+    start = perf_counter()
+    detector.process(np.zeros((256, 256, 3), np.uint8))
+    startup_times.setdefault('warm up detector', perf_counter() - start)
+    return detector
+
+
+def get_landmarks(image_rgb: np.ndarray, closed: bool, detector=None, hand_mask=None):
+    """
+    Get the pixel coordinates of the hand landmarks in the image.
+
+    If hand_mask (a hand_mask.HandMask of the image) is given, the edges are looked up in it.
+    """
+    landmarks = get_mediapipe_landmarks(image_rgb, detector)
+    if landmarks is None:
+        return None
+
+    line_edge = get_line_edge if hand_mask is None else hand_mask.line_edge
+    return (get_landmarks_closed(image_rgb, landmarks, line_edge) if closed else
+            get_landmarks_opened(image_rgb, landmarks, line_edge))
+
 
-def get_landmarks(image_rgb: np.ndarray, closed: bool, detector=Hands(static_image_mode=True, max_num_hands=1)):
-    """Get the pixel coordinates of the hand landmarks in the image."""
-    results = detector.process(image_rgb)
+def get_mediapipe_landmarks(image_rgb: np.ndarray, detector=None):
+    """Get the pixel coordinates of the MediaPipe Hand landmarks in the image."""
+    results = (detector or get_detector()).process(image_rgb)
 
     if results is None or results.multi_hand_landmarks is None:
         # No hand detected.
@@ -25,12 +83,13 @@ def get_landmarks(image_rgb: np.ndarray, closed: bool, detector=Hands(static_ima
     landmarks[:, 0] *= image_rgb.shape[1]
     landmarks[:, 1] *= image_rgb.shape[0]
 
-    return get_landmarks_closed(image_rgb, landmarks) if closed else get_landmarks_opened(image_rgb, landmarks)
+    return landmarks
 
 
-def get_landmarks_opened(image, landmarks_mediapipe: np.ndarray):
+def get_landmarks_opened(image, landmarks_mediapipe: np.ndarray, line_edge=None):
     lmk_mp = np.round(landmarks_mediapipe)
     """MediaPipe Hand landmarks."""
+    line_edge = line_edge or get_line_edge
 
     lmk = np.zeros((len(points_interest_opened), 2), int)
     """Our landmarks."""
@@ -54,53 +113,54 @@ def get_landmarks_opened(image, landmarks_mediapipe: np.ndarray):
     """
 
     # THUMB
-    lmk[O_f1Tip] = get_line_edge(image, lmk_mp[THUMB_TIP], 2 * lmk_mp[THUMB_TIP] - lmk_mp[THUMB_IP])
+    lmk[O_f1Tip] = line_edge(image, lmk_mp[THUMB_TIP], 2 * lmk_mp[THUMB_TIP] - lmk_mp[THUMB_IP])
     finger_direction = lmk_mp[THUMB_TIP] - lmk_mp[THUMB_MCP]
-    lmk[O_f1DistalR] = get_line_edge(image, lmk_mp[THUMB_IP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f1DistalL] = get_line_edge(image, lmk_mp[THUMB_IP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f1DistalR] = line_edge(image, lmk_mp[THUMB_IP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f1DistalL] = line_edge(image, lmk_mp[THUMB_IP], direction=[finger_direction[1], -finger_direction[0]])
 
     # INDEX
-    lmk[O_f2Tip] = get_line_edge(image, lmk_mp[INDEX_FINGER_TIP], 2 * lmk_mp[INDEX_FINGER_TIP] - lmk_mp[INDEX_FINGER_PIP])
+    lmk[O_f2Tip] = line_edge(image, lmk_mp[INDEX_FINGER_TIP], 2 * lmk_mp[INDEX_FINGER_TIP] - lmk_mp[INDEX_FINGER_PIP])
     finger_direction = lmk_mp[INDEX_FINGER_TIP] - lmk_mp[INDEX_FINGER_PIP]
-    lmk[O_f2DistalR] = get_line_edge(image, lmk_mp[INDEX_FINGER_DIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f2DistalL] = get_line_edge(image, lmk_mp[INDEX_FINGER_DIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f2DistalR] = line_edge(image, lmk_mp[INDEX_FINGER_DIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f2DistalL] = line_edge(image, lmk_mp[INDEX_FINGER_DIP], direction=[finger_direction[1], -finger_direction[0]])
     finger_direction = lmk_mp[INDEX_FINGER_DIP] - lmk_mp[INDEX_FINGER_MCP]
-    lmk[O_f2MedialR] = get_line_edge(image, lmk_mp[INDEX_FINGER_PIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f2MedialL] = get_line_edge(image, lmk_mp[INDEX_FINGER_PIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f2MedialR] = line_edge(image, lmk_mp[INDEX_FINGER_PIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f2MedialL] = line_edge(image, lmk_mp[INDEX_FINGER_PIP], direction=[finger_direction[1], -finger_direction[0]])
 
     # MIDDLE
-    lmk[O_f3Tip] = get_line_edge(image, lmk_mp[MIDDLE_FINGER_TIP], 2 * lmk_mp[MIDDLE_FINGER_TIP] - lmk_mp[MIDDLE_FINGER_PIP])
+    lmk[O_f3Tip] = line_edge(image, lmk_mp[MIDDLE_FINGER_TIP], 2 * lmk_mp[MIDDLE_FINGER_TIP] - lmk_mp[MIDDLE_FINGER_PIP])
     finger_direction = lmk_mp[MIDDLE_FINGER_TIP] - lmk_mp[MIDDLE_FINGER_PIP]
-    lmk[O_f3DistalR] = get_line_edge(image, lmk_mp[MIDDLE_FINGER_DIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f3DistalL] = get_line_edge(image, lmk_mp[MIDDLE_FINGER_DIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f3DistalR] = line_edge(image, lmk_mp[MIDDLE_FINGER_DIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f3DistalL] = line_edge(image, lmk_mp[MIDDLE_FINGER_DIP], direction=[finger_direction[1], -finger_direction[0]])
     finger_direction = lmk_mp[MIDDLE_FINGER_DIP] - lmk_mp[MIDDLE_FINGER_MCP]
-    lmk[O_f3MedialR] = get_line_edge(image, lmk_mp[MIDDLE_FINGER_PIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f3MedialL] = get_line_edge(image, lmk_mp[MIDDLE_FINGER_PIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f3MedialR] = line_edge(image, lmk_mp[MIDDLE_FINGER_PIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f3MedialL] = line_edge(image, lmk_mp[MIDDLE_FINGER_PIP], direction=[finger_direction[1], -finger_direction[0]])
 
     # RING
-    lmk[O_f4Tip] = get_line_edge(image, lmk_mp[RING_FINGER_TIP], 2 * lmk_mp[RING_FINGER_TIP] - lmk_mp[RING_FINGER_PIP])
+    lmk[O_f4Tip] = line_edge(image, lmk_mp[RING_FINGER_TIP], 2 * lmk_mp[RING_FINGER_TIP] - lmk_mp[RING_FINGER_PIP])
     finger_direction = lmk_mp[RING_FINGER_TIP] - lmk_mp[RING_FINGER_PIP]
-    lmk[O_f4DistalR] = get_line_edge(image, lmk_mp[RING_FINGER_DIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f4DistalL] = get_line_edge(image, lmk_mp[RING_FINGER_DIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f4DistalR] = line_edge(image, lmk_mp[RING_FINGER_DIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f4DistalL] = line_edge(image, lmk_mp[RING_FINGER_DIP], direction=[finger_direction[1], -finger_direction[0]])
     finger_direction = lmk_mp[RING_FINGER_DIP] - lmk_mp[RING_FINGER_MCP]
-    lmk[O_f4MedialR] = get_line_edge(image, lmk_mp[RING_FINGER_PIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f4MedialL] = get_line_edge(image, lmk_mp[RING_FINGER_PIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f4MedialR] = line_edge(image, lmk_mp[RING_FINGER_PIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f4MedialL] = line_edge(image, lmk_mp[RING_FINGER_PIP], direction=[finger_direction[1], -finger_direction[0]])
 
     # PINKY
-    lmk[O_f5Tip] = get_line_edge(image, lmk_mp[PINKY_TIP], 2 * lmk_mp[PINKY_TIP] - lmk_mp[PINKY_PIP])
+    lmk[O_f5Tip] = line_edge(image, lmk_mp[PINKY_TIP], 2 * lmk_mp[PINKY_TIP] - lmk_mp[PINKY_PIP])
     finger_direction = lmk_mp[PINKY_TIP] - lmk_mp[PINKY_PIP]
-    lmk[O_f5DistalR] = get_line_edge(image, lmk_mp[PINKY_DIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f5DistalL] = get_line_edge(image, lmk_mp[PINKY_DIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f5DistalR] = line_edge(image, lmk_mp[PINKY_DIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f5DistalL] = line_edge(image, lmk_mp[PINKY_DIP], direction=[finger_direction[1], -finger_direction[0]])
     finger_direction = lmk_mp[PINKY_DIP] - lmk_mp[PINKY_MCP]
-    lmk[O_f5MedialR] = get_line_edge(image, lmk_mp[PINKY_PIP], direction=[-finger_direction[1], finger_direction[0]])
-    lmk[O_f5MedialL] = get_line_edge(image, lmk_mp[PINKY_PIP], direction=[finger_direction[1], -finger_direction[0]])
+    lmk[O_f5MedialR] = line_edge(image, lmk_mp[PINKY_PIP], direction=[-finger_direction[1], finger_direction[0]])
+    lmk[O_f5MedialL] = line_edge(image, lmk_mp[PINKY_PIP], direction=[finger_direction[1], -finger_direction[0]])
 
     return lmk
 
 
-def get_landmarks_closed(image, lmk_mp: np.ndarray):
+def get_landmarks_closed(image, lmk_mp: np.ndarray, line_edge=None):
     lmk_mp = np.round(lmk_mp)
     """MediaPipe Hand landmarks."""
+    line_edge = line_edge or get_line_edge
 
     lmk = np.zeros((len(points_interest_closed), 2), int)
     """Our landmarks."""
@@ -122,33 +182,33 @@ def get_landmarks_closed(image, lmk_mp: np.ndarray):
     """
 
     # THUMB
-    lmk[C_f1Tip] = get_line_edge(image, lmk_mp[THUMB_TIP], 2 * lmk_mp[THUMB_TIP] - lmk_mp[THUMB_IP])
+    lmk[C_f1Tip] = line_edge(image, lmk_mp[THUMB_TIP], 2 * lmk_mp[THUMB_TIP] - lmk_mp[THUMB_IP])
     lmk[C_f1BaseC] = lmk_mp[THUMB_MCP] * .95 + lmk_mp[THUMB_CMC] * .05
     lmk[C_f1Defect] = lmk_mp[THUMB_MCP] * .7 + lmk_mp[INDEX_FINGER_MCP] * .3
 
     # INDEX
-    lmk[C_f2Tip] = get_line_edge(image, lmk_mp[INDEX_FINGER_TIP], 2 * lmk_mp[INDEX_FINGER_TIP] - lmk_mp[INDEX_FINGER_PIP])
+    lmk[C_f2Tip] = line_edge(image, lmk_mp[INDEX_FINGER_TIP], 2 * lmk_mp[INDEX_FINGER_TIP] - lmk_mp[INDEX_FINGER_PIP])
     lmk[C_f2BaseC] = lmk_mp[INDEX_FINGER_MCP] * (2 / 3) + lmk_mp[INDEX_FINGER_PIP] / 3
 
     # MIDDLE
-    lmk[C_f3Tip] = get_line_edge(image, lmk_mp[MIDDLE_FINGER_TIP], 2 * lmk_mp[MIDDLE_FINGER_TIP] - lmk_mp[MIDDLE_FINGER_PIP])
+    lmk[C_f3Tip] = line_edge(image, lmk_mp[MIDDLE_FINGER_TIP], 2 * lmk_mp[MIDDLE_FINGER_TIP] - lmk_mp[MIDDLE_FINGER_PIP])
     lmk[C_f3BaseC] = lmk_mp[MIDDLE_FINGER_MCP] * (2 / 3) + lmk_mp[MIDDLE_FINGER_PIP] / 3
 
     # RING
-    lmk[C_f4Tip] = get_line_edge(image, lmk_mp[RING_FINGER_TIP], 2 * lmk_mp[RING_FINGER_TIP] - lmk_mp[RING_FINGER_PIP])
+    lmk[C_f4Tip] = line_edge(image, lmk_mp[RING_FINGER_TIP], 2 * lmk_mp[RING_FINGER_TIP] - lmk_mp[RING_FINGER_PIP])
     lmk[C_f4BaseC] = lmk_mp[RING_FINGER_MCP] * (2 / 3) + lmk_mp[RING_FINGER_PIP] / 3
 
     # PINKY
-    lmk[C_f5Tip] = get_line_edge(image, lmk_mp[PINKY_TIP], 2 * lmk_mp[PINKY_TIP] - lmk_mp[PINKY_PIP])
+    lmk[C_f5Tip] = line_edge(image, lmk_mp[PINKY_TIP], 2 * lmk_mp[PINKY_TIP] - lmk_mp[PINKY_PIP])
     lmk[C_f5BaseC] = lmk_mp[PINKY_MCP] * (2 / 3) + lmk_mp[PINKY_PIP] / 3
 
     lmk[C_wristBaseC] = lmk_mp[WRIST] * 1.1 - lmk_mp[MIDDLE_FINGER_MCP] * .1
     lmk[C_palmBaseC] = lmk_mp[WRIST]
 
     # Move from the index and pinky MCPs away from the middle and ring MCPs respectively.
-    lmk[C_m1_2] = get_line_edge(image, lmk_mp[INDEX_FINGER_MCP], direction_scale=1,
+    lmk[C_m1_2] = line_edge(image, lmk_mp[INDEX_FINGER_MCP], direction_scale=1,
                                 direction=lmk_mp[INDEX_FINGER_MCP] - lmk_mp[MIDDLE_FINGER_MCP], )
-    lmk[C_m1_3] = get_line_edge(image, lmk_mp[PINKY_MCP], direction_scale=1,
+    lmk[C_m1_3] = line_edge(image, lmk_mp[PINKY_MCP], direction_scale=1,
                                 direction=lmk_mp[PINKY_MCP] - lmk_mp[RING_FINGER_MCP], )
 
     return lmk
@@ -0,0 +1,285 @@
+"""
+Leases to let several instances (reviewers or auto-detection computers) work on the same shared folder
+without processing the same image at the same time.
+
+Each image being processed has a lock file next to it (image.png.lock) with the owner of the lease.
+It's created atomically (it fails if it already exists), so only one instance can claim the image.
+While the image is being processed, a heartbeat touches the lock file every ttl / 3 seconds.
+When the image is done the lock file is deleted, and if its owner dies without deleting it,
+it expires ttl seconds after the last heartbeat and any other instance can claim the image.
+
+The expiry uses the modification time of the lock file, so the clocks of the computers must be roughly in sync
+(with a margin much smaller than the ttl).
+
+On a Windows share, a lock file can't be read, touched or deleted while another instance has it open.
+Those errors are never fatal: the file is just not claimed now, and a lock file that can't be deleted expires.
+
+To check that several processes on one folder process each file exactly once:
+    python lease.py [--processes 8] [--files 200]
+
+Usage:
+    for file, lease in claimed_files(path, os.listdir(path), ('.png', )):
+        ...  # Nobody else is processing this file.
+        if lease.check():
+            ...  # Save the results. The lease could have been lost (e.g. if the heartbeat didn't reach the share).
+"""
+
+import os
+import time
+import uuid
+import socket
+import argparse
+import tempfile
+import threading
+from multiprocessing import Pool
+
+LOCK_SUFFIX = '.lock'
+LEASE_TTL = 120
+"""Seconds without a heartbeat after which a lease expires."""
+
+
+def default_owner():
+    """Unique name of this instance: the computer, the process and a random part (in case the PID is reused)."""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class Lease:
+    def __init__(self, file: str, owner: str = None, ttl: float = LEASE_TTL):
+        self.path = file + LOCK_SUFFIX
+        """Path to the lock file."""
+        self.owner = owner or default_owner()
+        self.ttl = ttl
+        self.held = False
+        """Whether the lease is ours. It's lost if we don't renew it in time and someone else claims the file."""
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def acquire(self) -> bool:
+        """Try to claim the file. Returns whether it succeeded. It doesn't wait."""
+        # Second try only if there was an expired lease that we just removed.
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._break_expired():
+                    return False
+                continue
+            except OSError:
+                # E.g. Windows refuses to create a file that's being deleted. Someone else is on it.
+                return False
+            with os.fdopen(fd, 'w') as file:
+                file.write(self.owner)
+
+            self.held = True
+            self._stop.clear()
+            self._heartbeat = threading.Thread(target=self._beat, name=f'heartbeat {self.path}', daemon=True)
+            self._heartbeat.start()
+            return True
+        return False
+
+    def renew(self) -> bool:
+        """Extend the lease another ttl seconds. Returns False if it's no longer ours."""
+        if self.current_owner() != self.owner:
+            self.held = False
+            return False
+        os.utime(self.path)
+        return True
+
+    def release(self):
+        """Stop the heartbeat and delete the lock file (if it's still ours), so the file goes back to the pool."""
+        self._stop.set()
+        if self._heartbeat is not None and self._heartbeat is not threading.current_thread():
+            self._heartbeat.join()
+        self._heartbeat = None
+        try:
+            if self.held and self.current_owner() == self.owner:
+                os.remove(self.path)
+        except OSError:
+            # Already gone or in use by another instance. If it's left behind, it will expire.
+            pass
+        self.held = False
+
+    def current_owner(self):
+        """Owner written in the lock file or None if there's no lock file. Other OSErrors are raised."""
+        try:
+            with open(self.path, 'r') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def expired(self, path=None) -> bool:
+        """Whether the lock file (or the given file) hasn't been touched in the last ttl seconds."""
+        try:
+            return os.path.getmtime(path or self.path) + self.ttl < time.time()
+        except FileNotFoundError:
+            return True
+
+    def _beat(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    print(f'Se ha perdido el bloqueo de {self.path}.')
+                    return
+            except OSError:
+                # Probably a network hiccup. Try again in the next beat. If it lasts too long, the lease will expire.
+                pass
+
+    def check(self) -> bool:
+        """Whether the lease is still ours, asking the lock file now (not waiting for the next heartbeat)."""
+        try:
+            return self.held and self.renew()
+        except OSError:
+            # Can't tell (probably a network hiccup). Trust the heartbeat.
+            return self.held
+
+    def _break_expired(self) -> bool:
+        """Remove the lock file if it has expired. Returns whether it can be claimed again."""
+        try:
+            stale_owner = self.current_owner()
+            stale_mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            # Someone has just released or broken it. Try to claim it again.
+            return True
+        except OSError:
+            # Someone else is using it right now. Can't claim it now.
+            return False
+        if stale_mtime + self.ttl >= time.time():
+            return False
+
+        # Several instances may find the same expired lease, and one of them may have already broken it
+        # and claimed the file again. Renaming is atomic, so only one instance moves each lock file away,
+        # but it may not be the one we read. Check it before throwing it away.
+        tombstone = f'{self.path}.{uuid.uuid4().hex[:8]}.stale'
+        try:
+            os.rename(self.path, tombstone)
+        except OSError:
+            # Someone else moved it first.
+            return False
+
+        try:
+            with open(tombstone, 'r') as file:
+                owner = file.read()
+            if owner == stale_owner and os.path.getmtime(tombstone) == stale_mtime:
+                return True
+            # It was a new lease. Put it back as it was (unless the file has already been claimed again).
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w') as file:
+                file.write(owner)
+            os.utime(self.path, (time.time(), os.path.getmtime(tombstone)))
+            return False
+        except OSError:
+            # The file has already been claimed again (the owner of the new lease will notice it lost it, see check)
+            # or the tombstone can't be read right now. Either way, it can't be claimed now.
+            return False
+        finally:
+            try:
+                os.remove(tombstone)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+def claimed_files(path: str, files: list, suffixes=('.png', ), ttl: float = LEASE_TTL, owner: str = None, skip=None):
+    """
+    Yield the names of the files in path (with the given suffixes) that nobody else is processing, one at a time,
+    and their leases.
+
+    Each file is leased while it's being processed, i.e., until the next one is requested.
+    After each file the folder is listed again, so files released or expired by other instances
+    (and new files) are taken into account. Each file is yielded only once.
+
+    skip is an optional function that takes the file name and returns True if it has already been processed
+    (by anyone). It's checked once the file is claimed, so it sees the work of the previous owner.
+    """
+    owner = owner or default_owner()
+    done = set()
+    while True:
+        for file in files:
+            if not file.endswith(suffixes) or file in done:
+                continue
+            lease = Lease(os.path.join(path, file), owner, ttl)
+            if not lease.acquire():
+                continue
+            # Someone else may have just finished it (and moved it away) while the folder was being listed.
+            if os.path.exists(os.path.join(path, file)) and not (skip and skip(file)):
+                break
+            done.add(file)
+            lease.release()
+        else:
+            # Every remaining file is being processed by someone else.
+            return
+
+        done.add(file)
+        try:
+            yield file, lease
+        finally:
+            lease.release()
+        files = os.listdir(path)
+
+
+def _process_all(path):
+    """Claim and process (move to path/done) every file in path. Returns the processed files."""
+    processed = []
+    for file, lease in claimed_files(path, os.listdir(path), ('.png', ), ttl=5):
+        processed.append(file)
+        time.sleep(.002)
+        if lease.check():
+            os.rename(os.path.join(path, file), os.path.join(path, 'done', file))
+    return processed
+
+
+def _race_expired(path):
+    """Try to claim a file whose lease has expired. Returns whether it succeeded (and keeps it a while)."""
+    lease = Lease(path, ttl=5)
+    if not lease.acquire():
+        return False
+    time.sleep(.5)  # Keep it, so the slower racers can't claim it after it's released.
+    lease.release()
+    return True
+
+
+def check_concurrency(processes=8, files=200):
+    """Run several processes on one temporary folder and check that each file is processed exactly once."""
+    with tempfile.TemporaryDirectory() as path:
+        os.mkdir(os.path.join(path, 'done'))
+        for i in range(files):
+            open(os.path.join(path, f'{i}.png'), 'w').close()
+        # Some of them with an expired lease of a dead instance.
+        for i in range(0, files, 10):
+            with open(os.path.join(path, f'{i}.png' + LOCK_SUFFIX), 'w') as lock:
+                lock.write('dead')
+            os.utime(os.path.join(path, f'{i}.png' + LOCK_SUFFIX), (0, 0))
+
+        with Pool(processes) as pool:
+            processed = [file for result in pool.map(_process_all, [path] * processes) for file in result]
+        assert len(processed) == files, f'{len(processed)} files processed instead of {files}.'
+        assert len(set(processed)) == files, f'{len(processed) - len(set(processed))} files processed twice.'
+        left = sorted(set(os.listdir(path)) - {'done'})
+        assert not left, f'Files left in the folder: {left[:5]}'
+        print(f'{processes} processes: {files} files processed once each.')
+
+        # Everybody finds the same expired lease at the same time.
+        file = os.path.join(path, 'expired.png')
+        with open(file + LOCK_SUFFIX, 'w') as lock:
+            lock.write('dead')
+        os.utime(file + LOCK_SUFFIX, (0, 0))
+        with Pool(processes) as pool:
+            winners = sum(pool.map(_race_expired, [file] * processes))
+        assert winners == 1, f'{winners} processes claimed the same expired lease.'
+        print(f'{processes} processes racing for one expired lease: exactly one winner.')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check that several processes on one folder process each file once.')
+    parser.add_argument('--processes', type=int, default=8, help='Number of processes. (Default: 8)')
+    parser.add_argument('--files', type=int, default=200, help='Number of files. (Default: 200)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    check_concurrency(**parse_args().__dict__)
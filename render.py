@@ -0,0 +1,69 @@
+"""
+Drawing of the landmarks and the measures between them on the image.
+
+It doesn't need any window, so it can be used by the GUI (that shows the result)
+and by the auto mode (that only saves a preview, usually at a lower resolution, to check it later).
+"""
+
+import cv2
+import numpy as np
+
+from landmark_set import AUTO, INVALID, LandmarkSet
+from measure import mesure_closed, mesure_opened
+
+COLOR_SCHEME_POINTS = [[221, 229, 205], [227, 30, 58], [112, 110, 112], [233, 59, 147], [172, 212, 191], [22, 42, 79], [56, 137, 192], [52, 18, 199], [162, 247, 132], [54, 129, 157], [39, 29, 226], [164, 126, 30], [32, 70, 53], [220, 28, 142], [33, 249, 24], [127, 148, 194], [57, 206, 55], [162, 222, 243], [72, 148, 77], [169, 228, 236], [114, 69, 177], [145, 176, 127], [39, 208, 225], [237, 120, 42], [165, 135, 78], [0, 29, 129], [143, 144, 59], [7, 106, 219], [58, 78, 77], [38, 126, 209], [90, 198, 169], [59, 16, 221], [249, 96, 196], [162, 129, 137], [223, 9, 143], [216, 3, 123], [204, 156, 173], [134, 23, 5], [123, 202, 252], [154, 144, 40], [119, 43, 192], [192, 229, 58], [236, 161, 205], [18, 120, 170], [149, 176, 50], [94, 104, 174], [192, 67, 17], [20, 118, 178], [60, 210, 131], [110, 188, 212]]
+COLOR_SCHEME_POINTS = np.array(COLOR_SCHEME_POINTS, np.uint8)
+
+COLOR_SCHEME_MEASURES = {'handBreadthMeta_C_m1_3-C_m1_2': [221, 229, 205], 'handBreadthMeta_perpendicular_hand': [227, 30, 58], 'O_f1DistalL': [112, 110, 112], 'O_f2Tip': [233, 59, 147], 'O_f2DistalR': [172, 212, 191], 'O_f2DistalL': [22, 42, 79], 'O_f2MedialR': [56, 137, 192], 'O_f2MedialL': [52, 18, 199], 'O_f3Tip': [162, 247, 132], 'O_f3DistalR': [54, 129, 157], 'O_f3DistalL': [39, 29, 226], 'O_f3MedialR': [164, 126, 30], 'O_f3MedialL': [32, 70, 53], 'O_f4Tip': [220, 28, 142], 'O_f4DistalR': [33, 249, 24], 'O_f4DistalL': [127, 148, 194], 'O_f4MedialR': [57, 206, 55], 'O_f4MedialL': [162, 222, 243], 'O_f5Tip': [72, 148, 77], 'O_f5DistalR': [169, 228, 236], 'O_f5DistalL': [114, 69, 177], 'O_f5MedialR': [145, 176, 127], 'O_f5MedialL': [39, 208, 225], 'C_f1Tip': [221, 229, 205], 'C_f2Tip': [227, 30, 58], 'C_f3Tip': [112, 110, 112], 'C_f4Tip': [233, 59, 147], 'C_f5Tip': [172, 212, 191], 'C_f1BaseC': [22, 42, 79], 'C_f2BaseC': [56, 137, 192], 'C_f3BaseC': [52, 18, 199], 'C_f4BaseC': [162, 247, 132], 'C_f5BaseC': [54, 129, 157], 'C_f1Defect': [39, 29, 226], 'C_wristBaseC': [164, 126, 30], 'C_palmBaseC': [32, 70, 53], 'C_m1_2': [220, 28, 142], 'C_m1_3': [33, 249, 24], 'handLength': [221, 229, 205], 'palmLength': [227, 30, 58], 'handThumbLength': [112, 110, 112], 'handIndexLength': [233, 59, 147], 'handMidLength': [172, 212, 191], 'handFourLength': [22, 42, 79], 'handLittleLength': [56, 137, 192], 'handLengthCrotch': [52, 18, 199], 'handBreadthMeta_perpendicular_finger3': [162, 247, 132], 'handThumbBreadth': [54, 129, 157], 'handIndexBreadthDistal': [39, 29, 226], 'handMidBreadthDistal': [164, 126, 30], 'handFourBreadthDistal': [32, 70, 53], 'handLittleBreadthDistal': [220, 28, 142], 'handIndexBreadthProx': [33, 249, 24], 'handMidBreadthMid': [127, 148, 194], 'handFourBreadthMid': [57, 206, 55], 'handLittleBreadthMid': [162, 222, 243], 'handThumbLengthDistal': [72, 148, 77], 'handIndexLengthDistal': [169, 228, 236], 'handMidLengthDistal': [114, 69, 177], 'handFourLengthDistal': [145, 176, 127], 'handLittleLengthDistal': [39, 208, 225], 'handIndexLengthMid': [237, 120, 42], 'handMidLengthMid': [165, 135, 78], 'handFourLengthMid': [0, 29, 129], 'handLittleLengthMid': [143, 144, 59]}
+
+
+def draw_measures(image, landmarks: LandmarkSet, scale=1.):
+    """
+    Draw the landmarks and measures on the image (in place) and return it.
+
+    The landmarks are in the coordinates of the original image, scale is the size of the image relative to it.
+    """
+    radius = max(2, round(10 * scale))
+    thickness = max(1, round(2 * scale))
+    # Draw points
+    for (x, y), flags, color in zip((landmarks.coords * scale).round().astype(int).tolist(), landmarks.flags.tolist(),
+                                    COLOR_SCHEME_POINTS.tolist()):
+        # Ignore out of bounds points.
+        if not 0 <= y < image.shape[0] or not 0 <= x < image.shape[1]:
+            continue
+        # If the point is invalid, it doesn't count: paint it black.
+        # If the point was estimated by the model: paint it white.
+        # If the point was placed by the user: paint it red.
+        if flags & INVALID:
+            circle_color = (0, 0, 0)
+        elif flags & AUTO:
+            circle_color = (255, 255, 255)
+        else:
+            circle_color = (0, 0, 255)  # Red, opencv uses BGR
+        # Draw a cross at the point surrounded by a circle.
+        image[max(0, y - radius):y + radius + 1, x:x+1] = color
+        image[y:y+1, max(0, x - radius):x + radius + 1] = color
+        cv2.circle(image, (x, y), radius, circle_color, thickness)
+
+    measures = mesure_closed(landmarks) if landmarks.closed else mesure_opened(landmarks)
+    """Dict of measure names to (start, end, valid) points."""
+
+    # Draw measures.
+    for name, (start, end, _) in measures.items():
+        (x0, y0), (x1, y1) = (start * scale).round().astype(int).tolist(), (end * scale).round().astype(int).tolist()
+        cv2.line(image, (x0, y0), (x1, y1), COLOR_SCHEME_MEASURES[name], thickness)
+
+    return image
+
+
+def save_preview(image, landmarks: LandmarkSet, dst, scale=.5, quality=85):
+    """
+    Draw the landmarks and measures on a scaled copy of the (BGR) image and save it as a JPG in dst.
+
+    The image is the one already decoded for the detection, so it isn't read again. It won't be modified.
+    """
+    image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale != 1 else image.copy()
+
+    draw_measures(image, landmarks, scale)
+    cv2.imwrite(dst, image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return dst